@@ -1,8 +1,7 @@
 import streamlit as st
-import pandas as pd
 
 from utils.io import load_data
-from utils.prep import clean_irve_data
+from utils.prep import clean_irve_data, missing_rate, build_aggregates, source_columns
 
 # Sections
 from sections.intro import section_intro
@@ -28,7 +27,7 @@ st.sidebar.success("Dataset loaded successfully.")
 # --- Display quick dataset info before cleaning
 st.sidebar.markdown("### Dataset info (raw)")
 st.sidebar.write(f"Rows: {len(df_raw):,}")
-st.sidebar.write(f"Columns: {len(df_raw.columns)}")
+st.sidebar.write(f"Columns: {source_columns(df_raw)}")
 
 # =========================
 # DATA CLEANING (visible storytelling)
@@ -51,8 +50,7 @@ st.markdown(
     """
 )
 
-with st.spinner("Cleaning and preparing data..."):
-    df = clean_irve_data(df_raw)
+df = clean_irve_data(df_raw)
 
 # Compare before/after
 col1, col2 = st.columns(2)
@@ -60,8 +58,8 @@ with col1:
     st.metric("Rows before cleaning", f"{len(df_raw):,}")
 with col2:
     st.metric("Rows after cleaning", f"{len(df):,}")
-missing_before = df_raw.isna().mean().mean() * 100
-missing_after = df.isna().mean().mean() * 100
+missing_before = missing_rate(df_raw).mean() * 100
+missing_after = build_aggregates(df).missing_rate.mean() * 100
 st.caption(f"Average missing values reduced from **{missing_before:.1f}%** to **{missing_after:.1f}%** after cleaning.")
 
 st.divider()
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from utils.viz import bar_missingness
+from utils.prep import missing_rate, frame_key
 
 def _fmt_int(n) -> str:
     try:
@@ -9,29 +10,54 @@ def _fmt_int(n) -> str:
         return str(n)
 
 def _power_category_series(df: pd.DataFrame) -> pd.Series | None:
-    """Return a 'categorie_puissance' Series (create it if missing), otherwise None."""
+    """
+    Return a 'categorie_puissance' Series (create it if missing), otherwise None.
+    Kept categorical: comparisons run on the int codes, no per-row strings.
+    """
     if "categorie_puissance" in df.columns:
-        return df["categorie_puissance"].astype(str)
+        return df["categorie_puissance"]
     if "puissance_nominale" in df.columns:
-        s = pd.to_numeric(df["puissance_nominale"], errors="coerce")
+        s = df["puissance_nominale"]  # already float32 (typed by the loader)
         bins = [0, 22, 50, 150, 1000]
         labels = ["Normal (<22kW)", "Fast (22–50kW)", "Very fast (50–150kW)", "Ultra-fast (>150kW)"]
-        return pd.cut(s, bins=bins, labels=labels, right=False).astype(str)
+        return pd.cut(s, bins=bins, labels=labels, right=False, ordered=True)
     return None
 
 def _year_series(df: pd.DataFrame) -> pd.Series | None:
+    """Installation years: the precomputed column if present, else parsed from the dates."""
+    if "annee_mise_en_service" in df.columns:
+        s = df["annee_mise_en_service"]
+        return s if s.notna().any() else None
     if "date_mise_en_service" not in df.columns:
         return None
-    s = pd.to_datetime(df["date_mise_en_service"], errors="coerce")
+    s = pd.to_datetime(df["date_mise_en_service"], errors="coerce", format="%Y-%m-%d")
     if s.notna().any():
         return s.dt.year
     return None
 
-def section_conclusion(df_raw: pd.DataFrame):
-    st.header("3️ Conclusions — turn insights into action")
+def _count_duplicates(df: pd.DataFrame, keys: list[str]) -> int:
+    """
+    Count rows repeating an earlier key combination (same result as duplicated().sum()).
+    - If any single key column is unique, every combination is too: return 0 early
+      (is_unique is one C-level pass, no boolean mask).
+    - Otherwise groupby hashes the keys once instead of building a per-row tuple index.
+    """
+    if any(df[k].is_unique for k in keys):
+        return 0
+    if len(keys) == 1:
+        return int(df[keys[0]].duplicated().sum())
+    return len(df) - df.groupby(keys, dropna=False, sort=False).ngroups
 
-    # ---------- Build small dynamic facts ----------
-    total_points = len(df_raw)
+@st.cache_data(
+    show_spinner=False,
+    # WHY: df_raw comes from the cached loader, so shape + columns identify it
+    hash_funcs={pd.DataFrame: frame_key},
+)
+def _conclusion_stats(df_raw: pd.DataFrame) -> dict:
+    """
+    All full-frame statistics used by the conclusion, computed once per dataset.
+    WHY: widgets elsewhere trigger reruns; these numbers never change between them.
+    """
     cat_ser = _power_category_series(df_raw)
     ultra_share = None
     if cat_ser is not None and cat_ser.notna().any():
@@ -53,17 +79,62 @@ def section_conclusion(df_raw: pd.DataFrame):
                 growth_msg = "Installations surged recently (little or no activity four years ago)."
 
     # Missingness snapshot
-    avg_missing = df_raw.isna().mean().mean() * 100
+    miss = missing_rate(df_raw)
+    avg_missing = miss.mean() * 100
     top_missing = (
-        df_raw.isna().mean().sort_values(ascending=False).head(3) * 100
-        if len(df_raw.columns) > 0
+        miss.sort_values(ascending=False).head(3) * 100
+        if len(miss) > 0
         else pd.Series(dtype=float)
     )
     top_missing_list = [f"{k} ({v:.0f}%)" for k, v in top_missing.items()]
 
     # Duplicates check
     keys = [k for k in ["id_pdc_itinerance", "id_pdc_local"] if k in df_raw.columns]
-    dup_count = int(df_raw.duplicated(subset=keys).sum()) if keys else 0
+    dup_count = _count_duplicates(df_raw, keys) if keys else 0
+
+    # Simple anomaly checks
+    checks = []
+    if "puissance_nominale" in df_raw.columns:
+        neg = (df_raw["puissance_nominale"] < 0).sum()
+        checks.append(f"Negative power values: {_fmt_int(neg)}")
+    if "consolidated_latitude" in df_raw.columns:
+        bad_lat = ~df_raw["consolidated_latitude"].between(-90, 90).fillna(False)
+        checks.append(f"Latitude out of [-90,90]: {_fmt_int(bad_lat.sum())}")
+    if "consolidated_longitude" in df_raw.columns:
+        bad_lon = ~df_raw["consolidated_longitude"].between(-180, 180).fillna(False)
+        checks.append(f"Longitude out of [-180,180]: {_fmt_int(bad_lon.sum())}")
+
+    return dict(
+        total_points=len(df_raw),
+        ultra_share=ultra_share,
+        growth_msg=growth_msg,
+        avg_missing=avg_missing,
+        top_missing_list=top_missing_list,
+        keys=keys,
+        dup_count=dup_count,
+        checks=checks,
+    )
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: frame_key})
+def _missingness_chart(df_raw: pd.DataFrame) -> dict:
+    """
+    Missing-values figure for the raw dataset: built once, reused on every rerun.
+    Cached as a plain dict: cheaper to unpickle than a validated Figure.
+    """
+    return bar_missingness(df_raw, miss=missing_rate(df_raw)).to_dict()
+
+def section_conclusion(df_raw: pd.DataFrame):
+    st.header("3️ Conclusions — turn insights into action")
+
+    # ---------- Build small dynamic facts (cached) ----------
+    stats = _conclusion_stats(df_raw)
+    total_points = stats["total_points"]
+    ultra_share = stats["ultra_share"]
+    growth_msg = stats["growth_msg"]
+    avg_missing = stats["avg_missing"]
+    top_missing_list = stats["top_missing_list"]
+    keys = stats["keys"]
+    dup_count = stats["dup_count"]
 
     # ---------- Story banner ----------
     st.success(
@@ -110,20 +181,11 @@ def section_conclusion(df_raw: pd.DataFrame):
             st.write(f"Potential duplicates (using {', '.join(keys)}): {_fmt_int(dup_count)}")
         else:
             st.write("No unique keys available to detect duplicates.")
-        msgs = []
-        if "puissance_nominale" in df_raw.columns:
-            neg = (pd.to_numeric(df_raw["puissance_nominale"], errors="coerce") < 0).sum()
-            msgs.append(f"Negative power values: {_fmt_int(neg)}")
-        if "consolidated_latitude" in df_raw.columns:
-            bad_lat = ~df_raw["consolidated_latitude"].between(-90, 90)
-            msgs.append(f"Latitude out of [-90,90]: {_fmt_int(bad_lat.sum())}")
-        if "consolidated_longitude" in df_raw.columns:
-            bad_lon = ~df_raw["consolidated_longitude"].between(-180, 180)
-            msgs.append(f"Longitude out of [-180,180]: {_fmt_int(bad_lon.sum())}")
+        msgs = stats["checks"]
         st.write(" • " + "  \n • ".join(msgs) if msgs else "No simple anomalies detected.")
 
     st.subheader("Missing values (top columns)")
-    st.plotly_chart(bar_missingness(df_raw), use_container_width=True)
+    st.plotly_chart(_missingness_chart(df_raw), use_container_width=True)
 
     # ---------- Transparent limitations ----------
     st.markdown("### Limitations")
@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
-from utils.viz import bar_top_entities, bar_power_categories, hist_power_distribution
-import plotly.express as px
+import numpy as np
+from utils.viz import bar_top_entities, bar_power_categories, hist_power_distribution, entity_counts
+from utils.prep import sorted_unique, value_range, build_aggregates
 
 def _fmt_int(n) -> str:
     try:
@@ -9,44 +10,74 @@ def _fmt_int(n) -> str:
     except Exception:
         return str(n)
 
-def section_deep_dives(df: pd.DataFrame):
-    st.header("2️Deep dives — who runs it, and how fast can we charge?")
+def _category_counts(cats: pd.Series) -> pd.Series:
+    """
+    Points per power category present in the view.
+    Counted on the categorical codes directly; unused categories (0) are dropped.
+    """
+    vc = cats.value_counts()
+    return vc[vc > 0]
 
-    st.info(
-        "Why these dives? Operators affect reliability, pricing, and roaming. "
-        "Power levels define user experience (minutes vs. hours). "
-        "Understanding both helps target investments that actually move the needle."
+@st.cache_data(show_spinner=False)
+def _hist_stats(power_bytes: bytes) -> dict | None:
+    """
+    Median, upper quantiles and the two most populated power ranges of the power values.
+    Keyed on the raw float32 buffer (cheap to hash); reruns with the same selection hit the cache.
+    """
+    s_clean = np.frombuffer(power_bytes, dtype=np.float32)
+    if s_clean.size == 0:
+        return None
+
+    # One partition pass for the three quantiles (same linear method as Series.quantile)
+    p50, p75, p90 = np.percentile(s_clean, [50, 75, 90])
+
+    # Detect the two most populated power ranges (rough “peaks”)
+    counts, bin_edges = np.histogram(s_clean, bins=20)
+    top_idx = counts.argsort()[::-1][:2]  # indices of top 2 bins
+    peaks = []
+    for i in top_idx:
+        lo = bin_edges[i]
+        hi = bin_edges[i + 1]
+        peaks.append(f"{lo:.0f}–{hi:.0f} kW")
+
+    return dict(p50=p50, p75=p75, p90=p90, peaks=peaks)
+
+@st.fragment
+def _top_operators_block(df: pd.DataFrame):
+    """Top operators chart + story. A fragment: its local filters only rerun this block."""
+    st.subheader("Who operates the most points?")
+    st.caption("This ranking reveals market structure and potential single-points-of-failure.")
+    with st.expander("Top chart filters (local)"):
+        top_n = st.slider("Items to display", 5, 30, 15)
+        min_kW = st.number_input("Minimum power (kW)", min_value=0.0, value=0.0, step=1.0, help="Local filter")
+
+    # Boolean indexing already returns a new frame, no defensive copy needed
+    df_top = df
+    if "puissance_nominale" in df.columns:
+        keep = df["puissance_nominale"].fillna(0) >= float(min_kW)
+        if not keep.all():
+            df_top = df.loc[keep]
+
+    # Unfiltered view (the default): counts come from the cached aggregates
+    counts = None
+    if "nom_operateur" in df_top.columns:
+        counts = build_aggregates(df).operator_counts if df_top is df else entity_counts(df_top["nom_operateur"])
+
+    st.plotly_chart(
+        bar_top_entities(df_top, entity_col="nom_operateur", top_n=int(top_n), counts=counts),
+        use_container_width=True,
     )
 
-    # ===== Top operators (LOCAL filters) =====
-    colA, colB = st.columns([1, 1])
-    with colA:
-        st.subheader("Who operates the most points?")
-        st.caption("This ranking reveals market structure and potential single-points-of-failure.")
-        with st.expander("Top chart filters (local)"):
-            top_n = st.slider("Items to display", 5, 30, 15)
-            min_kW = st.number_input("Minimum power (kW)", min_value=0.0, value=0.0, step=1.0, help="Local filter")
-
-        df_top = df.copy()
-        if "puissance_nominale" in df_top.columns:
-            df_top = df_top[df_top["puissance_nominale"].fillna(0) >= float(min_kW)]
-
-        st.plotly_chart(
-            bar_top_entities(df_top, entity_col="nom_operateur", top_n=int(top_n)),
-            use_container_width=True,
-        )
-
-        # --- Storytelling under the bar chart: dynamic observations ---
-        if "nom_operateur" in df_top.columns and not df_top.empty:
-            counts = df_top["nom_operateur"].fillna("Unknown").value_counts()
-            total = int(counts.sum())
-            top_op = counts.index[0]
-            top_val = int(counts.iloc[0])
-            share = 100 * top_val / total if total else 0
-            top3 = counts.head(3)
-            top3_list = [f"{name} ({_fmt_int(val)})" for name, val in top3.items()]
-            st.markdown(
-                f"""
+    # --- Storytelling under the bar chart: dynamic observations ---
+    if counts is not None and not df_top.empty:
+        total = int(counts.sum())
+        top_op = counts.index[0]
+        top_val = int(counts.iloc[0])
+        share = 100 * top_val / total if total else 0
+        top3 = counts.head(3)
+        top3_list = [f"{name} ({_fmt_int(val)})" for name, val in top3.items()]
+        st.markdown(
+            f"""
 **What we can observe:**
 - {top_op} operates the largest number of points ({_fmt_int(top_val)}), about {share:.1f}% of the current view.
 - The Top 3 operators are: {", ".join(top3_list)}.
@@ -54,39 +85,47 @@ def section_deep_dives(df: pd.DataFrame):
 
 Why it matters: concentration can create dependencies (outage risk, pricing power), whereas fragmentation can reduce interoperability.
 """
-            )
-        else:
-            st.markdown(
-                "**What we can observe:** No operator data available for the current filter selection."
-            )
-
-        st.caption("Why it matters: concentration risks, competitive dynamics, and roaming priorities.")
+        )
+    else:
+        st.markdown(
+            "**What we can observe:** No operator data available for the current filter selection."
+        )
 
-    # ===== Power categories (LOCAL filters) =====
-    with colB:
-        st.subheader("What power levels are offered?")
-        st.caption("Power drives refuel time and shapes where people are comfortable switching to EVs.")
-        with st.expander("Category chart filters (local)"):
-            ops = sorted(df["nom_operateur"].dropna().unique()) if "nom_operateur" in df.columns else []
-            ops_sel = st.multiselect("Operators to include", ops, help="Local filter for this chart", max_selections=15)
-
-        df_cat = df.copy()
-        if ops_sel and "nom_operateur" in df_cat.columns:
-            df_cat = df_cat[df_cat["nom_operateur"].isin(ops_sel)]
-
-        st.plotly_chart(bar_power_categories(df_cat), use_container_width=True)
-
-        # --- Storytelling under the category chart: dynamic observations ---
-        if "categorie_puissance" in df_cat.columns and not df_cat.empty:
-            cat_counts = df_cat["categorie_puissance"].astype(str).value_counts()
-            total_c = int(cat_counts.sum())
-            dom_cat = cat_counts.idxmax()
-            dom_val = int(cat_counts.max())
-            dom_share = 100 * dom_val / total_c if total_c else 0
-            # Build a short list of categories with shares
-            cat_items = [f"{k} ({_fmt_int(v)} • {100*v/total_c:.1f}%)" for k, v in cat_counts.items()]
-            st.markdown(
-                f"""
+    st.caption("Why it matters: concentration risks, competitive dynamics, and roaming priorities.")
+
+@st.fragment
+def _power_categories_block(df: pd.DataFrame):
+    """Power category mix + story, rerun on its own when its filter changes."""
+    st.subheader("What power levels are offered?")
+    st.caption("Power drives refuel time and shapes where people are comfortable switching to EVs.")
+    with st.expander("Category chart filters (local)"):
+        ops = sorted_unique(df["nom_operateur"]) if "nom_operateur" in df.columns else []
+        ops_sel = st.multiselect("Operators to include", ops, help="Local filter for this chart", max_selections=15)
+
+    df_cat = df
+    if ops_sel and "nom_operateur" in df.columns:
+        df_cat = df.loc[df["nom_operateur"].isin(ops_sel)]
+
+    # Counted once for the chart and the story (cached aggregates when unfiltered)
+    cat_counts = None
+    if "categorie_puissance" in df_cat.columns:
+        if df_cat is df:
+            cat_counts = build_aggregates(df).category_counts
+        else:
+            cat_counts = _category_counts(df_cat["categorie_puissance"])
+
+    st.plotly_chart(bar_power_categories(df_cat, counts=cat_counts), use_container_width=True)
+
+    # --- Storytelling under the category chart: dynamic observations ---
+    if cat_counts is not None and not df_cat.empty:
+        total_c = int(cat_counts.sum())
+        dom_cat = cat_counts.idxmax()
+        dom_val = int(cat_counts.max())
+        dom_share = 100 * dom_val / total_c if total_c else 0
+        # Build a short list of categories with shares
+        cat_items = [f"{k} ({_fmt_int(v)} • {100*v/total_c:.1f}%)" for k, v in cat_counts.items()]
+        st.markdown(
+            f"""
 **What we can observe:**
 - {dom_cat} dominates the offer ({_fmt_int(dom_val)} points, {dom_share:.1f}% of the current view).
 - Mix by category: {", ".join(cat_items)}.
@@ -94,57 +133,43 @@ Why it matters: concentration can create dependencies (outage risk, pricing powe
 
 Takeaway: aligning the power mix with travel patterns is key to real-world usability.
 """
-            )
-        else:
-            st.markdown(
-                "**🔎 What we can observe:** No power-category data available for the current filter selection."
-            )
+        )
+    else:
+        st.markdown(
+            "**🔎 What we can observe:** No power-category data available for the current filter selection."
+        )
 
-        st.caption("Takeaway: higher shares of ultra-fast suggest better suitability for highways and long trips.")
+    st.caption("Takeaway: higher shares of ultra-fast suggest better suitability for highways and long trips.")
 
-    # ===== Power distribution (LOCAL filters) =====
+@st.fragment
+def _power_histogram_block(df: pd.DataFrame):
+    """Power distribution histogram + story, rerun on its own when its filters change."""
     st.subheader("How is power distributed?")
     st.caption("A distribution exposes outliers and shows whether the network clusters around common speeds.")
     with st.expander("Histogram filters (local)"):
-        pmin = float(df["puissance_nominale"].min()) if "puissance_nominale" in df.columns else 0.0
-        pmax = float(df["puissance_nominale"].max()) if "puissance_nominale" in df.columns else 350.0
+        pmin, pmax = value_range(df, "puissance_nominale") or (0.0, 350.0)
         p_range = st.slider("Power range (kW, local)", pmin, pmax, (pmin, pmax))
         nbins = st.slider("Number of bins", 10, 100, 40)
         cap99 = st.checkbox("Cap at 99th percentile (reduces outliers)", value=True)
 
-    df_hist = df.copy()
-    if "puissance_nominale" in df_hist.columns:
-        df_hist = df_hist[df_hist["puissance_nominale"].between(p_range[0], p_range[1], inclusive="both")]
+    df_hist = df
+    if "puissance_nominale" in df.columns:
+        df_hist = df.loc[df["puissance_nominale"].between(p_range[0], p_range[1], inclusive="both")]
 
     if not cap99:
-        s = pd.to_numeric(df_hist["puissance_nominale"], errors="coerce").dropna()
-        fig = px.histogram(s, nbins=int(nbins), title="Power distribution (kW) — no 99th cap")
-        fig.update_layout(xaxis_title="Power (kW)", yaxis_title="Number of points",
-                          margin=dict(l=10, r=10, t=60, b=10))
-        st.plotly_chart(fig, use_container_width=True)
+        fig = hist_power_distribution(
+            df_hist, nbins=int(nbins), cap99=False, title="Power distribution (kW) — no 99th cap"
+        )
     else:
-        st.plotly_chart(hist_power_distribution(df_hist, nbins=int(nbins)), use_container_width=True)
+        fig = hist_power_distribution(df_hist, nbins=int(nbins))
+    st.plotly_chart(fig, use_container_width=True)
 
     # --- Storytelling under the histogram (dynamic, concise, decision-focused) ---
     if "puissance_nominale" in df_hist.columns and not df_hist.empty:
-        import numpy as np
-
-        s_clean = pd.to_numeric(df_hist["puissance_nominale"], errors="coerce").dropna()
+        stats = _hist_stats(df_hist["puissance_nominale"].dropna().to_numpy(dtype=np.float32).tobytes())
 
-        if not s_clean.empty:
-            # Core stats
-            p50 = s_clean.median()
-            p75 = s_clean.quantile(0.75)
-            p90 = s_clean.quantile(0.90)
-
-            # Detect the two most populated power ranges (rough “peaks”)
-            counts, bin_edges = np.histogram(s_clean, bins=20)
-            top_idx = counts.argsort()[::-1][:2]  # indices of top 2 bins
-            peaks = []
-            for i in top_idx:
-                lo = bin_edges[i]
-                hi = bin_edges[i + 1]
-                peaks.append(f"{lo:.0f}–{hi:.0f} kW")
+        if stats is not None:
+            p50, p75, p90, peaks = stats["p50"], stats["p75"], stats["p90"], stats["peaks"]
 
             st.markdown(
                 f"""
@@ -161,3 +186,24 @@ Takeaway: aligning the power mix with travel patterns is key to real-world usabi
             st.markdown("**What we can observe:** No valid power values for the current selection.")
     else:
         st.markdown("**What we can observe:** Histogram unavailable for the current selection.")
+
+def section_deep_dives(df: pd.DataFrame):
+    st.header("2️Deep dives — who runs it, and how fast can we charge?")
+
+    st.info(
+        "Why these dives? Operators affect reliability, pricing, and roaming. "
+        "Power levels define user experience (minutes vs. hours). "
+        "Understanding both helps target investments that actually move the needle."
+    )
+
+    # ===== Top operators (LOCAL filters) =====
+    colA, colB = st.columns([1, 1])
+    with colA:
+        _top_operators_block(df)
+
+    # ===== Power categories (LOCAL filters) =====
+    with colB:
+        _power_categories_block(df)
+
+    # ===== Power distribution (LOCAL filters) =====
+    _power_histogram_block(df)
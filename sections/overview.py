@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from utils.viz import map_irve_points, line_installations_over_time
+from utils.viz import map_irve_points, line_installations_over_time, grid_aggregate_points
+from utils.prep import sorted_unique, value_range
 
 def _nice_int(n) -> str:
     try:
@@ -8,50 +9,54 @@ def _nice_int(n) -> str:
     except Exception:
         return str(n)
 
-def section_overview(df: pd.DataFrame, df_raw: pd.DataFrame):
-    st.header("1️ Overview — the big picture")
-
-    st.markdown("**Story goal:** Establish the current scale, where points are, and how fast deployments are moving.")
-    st.info("Why start here? A good story answers how big, where, and how it’s changing before any deep dive.")
+# Above this many points the map shows grid cells instead of individual points
+MAP_MAX_POINTS = 50_000
 
-    # ===== KPIs (tied to cleaned, filtered data) =====
-    total_points = len(df)
-    median_kw = df["puissance_nominale"].median() if "puissance_nominale" in df.columns and df["puissance_nominale"].notna().any() else None
-    ultra_share = ((df["categorie_puissance"] == "Ultra-fast (>150kW)").mean() * 100) if "categorie_puissance" in df.columns and df["categorie_puissance"].notna().any() else None
+# max_entries: one entry per filter selection; keep only the recent ones in memory
+@st.cache_data(show_spinner=False, max_entries=16)
+def _map_cells(df_map: pd.DataFrame) -> pd.DataFrame:
+    """Grid-aggregated map view, cached per filter selection."""
+    return grid_aggregate_points(df_map)
 
-    c1, c2, c3 = st.columns(3)
-    c1.metric("Charging points (current view)", _nice_int(total_points))
-    if median_kw is not None:
-        c2.metric("Median power (kW)", f"{median_kw:.1f}")
-    if ultra_share is not None:
-        c3.metric("Share >150 kW", f"{ultra_share:.1f} %")
-
-    st.caption("These KPIs answer: How big is the network? How fast can I typically charge? Is ultra-fast deployment significant?")
-
-    # ===== Map (LOCAL filters — no communes) =====
+@st.fragment
+def _map_block(df: pd.DataFrame):
+    """Map + story. A fragment: its local filters only rerun this block."""
     st.subheader("Where are the points?")
     st.write("We use a map because infrastructure is inherently geographic: corridors, clusters, and deserts become visible at a glance.")
 
     with st.expander("Map filters (local)"):
         cat_vals = df["categorie_puissance"].dropna().unique() if "categorie_puissance" in df.columns else []
         cats_sel = st.multiselect("Power categories (local)", cat_vals)
-        pwr_min_map = st.slider(
-            "Minimum power (kW, local)",
-            float(df["puissance_nominale"].min()) if "puissance_nominale" in df.columns else 0.0,
-            float(df["puissance_nominale"].max()) if "puissance_nominale" in df.columns else 350.0,
-            float(df["puissance_nominale"].min()) if "puissance_nominale" in df.columns else 0.0,
+        pmin, pmax = value_range(df, "puissance_nominale") or (0.0, 350.0)
+        pwr_min_map = st.slider("Minimum power (kW, local)", pmin, pmax, pmin)
+
+    # One combined mask, one indexing pass (boolean indexing already returns a new frame)
+    mask = pd.Series(True, index=df.index)
+    if len(cats_sel) > 0 and "categorie_puissance" in df.columns:
+        mask &= df["categorie_puissance"].isin(cats_sel)
+    if "puissance_nominale" in df.columns:
+        mask &= df["puissance_nominale"].fillna(0) >= pwr_min_map
+    df_map = df.loc[mask]
+
+    # Large views: send one aggregated cell per ~5 km instead of every point
+    if len(df_map) > MAP_MAX_POINTS:
+        map_cols = ["consolidated_latitude", "consolidated_longitude", "puissance_nominale"]
+        df_view = _map_cells(df_map[[c for c in map_cols if c in df_map.columns]])
+        tooltip_cols = ["nb_points"]
+        hover_hint = "Hover a cell to see its number of points and average power."
+        st.caption(
+            f"{_nice_int(len(df_map))} points grouped into {_nice_int(len(df_view))} cells (~5 km) "
+            "to keep the map responsive; power shown is the cell average."
         )
-
-    df_map = df.copy()
-    if len(cats_sel) > 0 and "categorie_puissance" in df_map.columns:
-        df_map = df_map[df_map["categorie_puissance"].isin(cats_sel)]
-    if "puissance_nominale" in df_map.columns:
-        df_map = df_map[df_map["puissance_nominale"].fillna(0) >= pwr_min_map]
+    else:
+        df_view = df_map
+        tooltip_cols = [c for c in ["nom_operateur", "nom_amenageur", "nom_commune"] if c in df_map.columns]
+        hover_hint = "Hover to see operator/municipality/power."
 
     st.pydeck_chart(
     map_irve_points(
-        df_map,
-        tooltip_cols=[c for c in ["nom_operateur", "nom_amenageur", "nom_commune"] if c in df_map.columns],
+        df_view,
+        tooltip_cols=tooltip_cols,
     ),
     use_container_width=True,
 )
@@ -68,10 +73,11 @@ def section_overview(df: pd.DataFrame, df_raw: pd.DataFrame):
         """
     )
 
-    st.caption("Why it matters: location drives accessibility and equity. Hover to see operator/municipality/power.")
-
+    st.caption(f"Why it matters: location drives accessibility and equity. {hover_hint}")
 
-    # ===== Time series (LOCAL filters) =====
+@st.fragment
+def _timeseries_block(df: pd.DataFrame):
+    """Deployment time series + story, rerun on its own when its filters change."""
     st.subheader("How is deployment evolving?")
     st.write("A time trend shows whether deployment is accelerating, stable, or slowing, crucial for policy and investment pacing.")
 
@@ -79,19 +85,21 @@ def section_overview(df: pd.DataFrame, df_raw: pd.DataFrame):
         freq = st.selectbox("Frequency", ["Y (yearly)", "Q (quarterly)", "M (monthly)"], index=0)
         freq_map = {"Y (yearly)": "Y", "Q (quarterly)": "Q", "M (monthly)": "M"}
         freq_code = freq_map[freq]
-        ops = sorted(df["nom_operateur"].dropna().unique()) if "nom_operateur" in df.columns else []
+        ops = sorted_unique(df["nom_operateur"]) if "nom_operateur" in df.columns else []
         ops_sel = st.multiselect("Operators (local)", ops, max_selections=10)
-        if "annee_mise_en_service" in df.columns and df["annee_mise_en_service"].notna().any():
-            ymin, ymax = int(df["annee_mise_en_service"].min()), int(df["annee_mise_en_service"].max())
+        y_range = value_range(df, "annee_mise_en_service")
+        if y_range is not None:
+            ymin, ymax = int(y_range[0]), int(y_range[1])
             ysel = st.slider("Year range (local)", ymin, ymax, (ymin, ymax))
         else:
             ysel = None
 
-    df_ts = df.copy()
-    if ops_sel and "nom_operateur" in df_ts.columns:
-        df_ts = df_ts[df_ts["nom_operateur"].isin(ops_sel)]
-    if ysel and "annee_mise_en_service" in df_ts.columns:
-        df_ts = df_ts[df_ts["annee_mise_en_service"].between(ysel[0], ysel[1])]
+    mask = pd.Series(True, index=df.index)
+    if ops_sel and "nom_operateur" in df.columns:
+        mask &= df["nom_operateur"].isin(ops_sel)
+    if ysel and "annee_mise_en_service" in df.columns:
+        mask &= df["annee_mise_en_service"].between(ysel[0], ysel[1])
+    df_ts = df.loc[mask]
 
     st.plotly_chart(line_installations_over_time(df_ts, freq=freq_code), use_container_width=True)
 
@@ -109,3 +117,28 @@ def section_overview(df: pd.DataFrame, df_raw: pd.DataFrame):
 
     st.caption("Takeaway: Acceleration suggests momentum; plateaus may point to permitting or supply bottlenecks.")
 
+def section_overview(df: pd.DataFrame, df_raw: pd.DataFrame):
+    st.header("1️ Overview — the big picture")
+
+    st.markdown("**Story goal:** Establish the current scale, where points are, and how fast deployments are moving.")
+    st.info("Why start here? A good story answers how big, where, and how it’s changing before any deep dive.")
+
+    # ===== KPIs (tied to cleaned, filtered data) =====
+    total_points = len(df)
+    median_kw = df["puissance_nominale"].median() if "puissance_nominale" in df.columns and df["puissance_nominale"].notna().any() else None
+    ultra_share = ((df["categorie_puissance"] == "Ultra-fast (>150kW)").mean() * 100) if "categorie_puissance" in df.columns and df["categorie_puissance"].notna().any() else None
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Charging points (current view)", _nice_int(total_points))
+    if median_kw is not None:
+        c2.metric("Median power (kW)", f"{median_kw:.1f}")
+    if ultra_share is not None:
+        c3.metric("Share >150 kW", f"{ultra_share:.1f} %")
+
+    st.caption("These KPIs answer: How big is the network? How fast can I typically charge? Is ultra-fast deployment significant?")
+
+    # ===== Map (LOCAL filters — no communes) =====
+    _map_block(df)
+
+    # ===== Time series (LOCAL filters) =====
+    _timeseries_block(df)
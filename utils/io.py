@@ -1,26 +1,164 @@
+import json
 import os
+import time
+from urllib.request import urlopen
+
 import pandas as pd
+import polars as pl
 import streamlit as st
 
 # URL officielle du jeu de données IRVE consolidé (Etalab)
 DATA_URL = "https://www.data.gouv.fr/api/1/datasets/r/eb76d20a-8501-400e-b336-d85724de5435"
 
-@st.cache_data(show_spinner=True)
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+# Optional local copy of the CSV: used instead of the download when present
+LOCAL_CSV_PATH = os.path.join(DATA_DIR, "irve.csv")
+# Local Parquet snapshot of the parsed CSV (skips download + parsing on cold starts)
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "irve_raw.parquet")
+# Cleaned dataset written by prep.build_cache (for analysis outside the app)
+CLEAN_PATH = os.path.join(DATA_DIR, "irve_clean.parquet")
+SNAPSHOT_MAX_AGE = 24 * 3600  # seconds; remote data is refreshed after this
+# Parquet metadata key holding the raw null counts of the snapshot (see _read_irve_csv)
+NULL_COUNTS_KEY = "irve_null_counts"
+
+# Columns the dashboard actually reads (cleaning, KPIs, charts, quality checks).
+# Everything else in the IRVE schema is skipped at parse time.
+USED_COLS = [
+    "id_pdc_itinerance", "id_pdc_local",
+    "nom_amenageur", "nom_operateur", "nom_commune",
+    "consolidated_latitude", "consolidated_longitude",
+    "puissance_nominale", "date_mise_en_service",
+]
+
+# float32 is plenty for coordinates (< 1 m) and power; names are low-cardinality.
+USED_DTYPES = {
+    "consolidated_latitude": pl.Float32,
+    "consolidated_longitude": pl.Float32,
+    "puissance_nominale": pl.Float32,
+    "nom_amenageur": pl.Categorical,
+    "nom_operateur": pl.Categorical,
+    "nom_commune": pl.Categorical,
+}
+
+def _read_irve_csv(source) -> tuple[pl.DataFrame, dict]:
+    """
+    WHY: parsing is the biggest one-shot cost, and most IRVE columns are never used.
+    - Only the USED_COLS present in the header are parsed (the rest are skipped).
+    - Explicit dtypes avoid inference and keep numbers compact.
+    - Numbers are read as text, counted, then cast: a malformed value is present
+      in the raw file, so it must not count as missing in the "before cleaning"
+      stats (the cleaner is what nulls it). Names parse straight to categories
+      (nothing to reject there); other columns stay text.
+    Returns the frame and its raw stats: row count, source column count
+    (from the header) and null counts of the parsed columns.
+    """
+    header = pl.read_csv(source, n_rows=0).columns
+    cols = [c for c in header if c.strip().lower() in USED_COLS]
+    dtypes = {c: USED_DTYPES.get(c.strip().lower(), pl.String) for c in cols}
+    numeric = [c for c, t in dtypes.items() if t.is_numeric()]
+    df = pl.read_csv(
+        source,
+        separator=",",
+        columns=cols,
+        schema_overrides={c: pl.String if c in numeric else t for c, t in dtypes.items()},
+        ignore_errors=True,
+    )
+    stats = {
+        "n_rows": df.height,
+        "n_cols": len(header),
+        "counts": {c: int(v) for c, v in df.null_count().row(0, named=True).items()},
+    }
+    df = df.with_columns(pl.col(c).cast(dtypes[c], strict=False) for c in numeric)
+    return df, stats
+
+def read_irve_csv(source) -> pl.DataFrame:
+    """Parse an IRVE CSV (path or bytes) into the projected, typed frame (see _read_irve_csv)."""
+    return _read_irve_csv(source)[0]
+
+def _snapshot_is_fresh(path: str = SNAPSHOT_PATH, source: str = LOCAL_CSV_PATH) -> bool:
+    """
+    WHY: a snapshot is only valid if it is not older than the data it was built from.
+    - Local CSV: compare modification times.
+    - Remote file: no cheap modification date, so trust it for SNAPSHOT_MAX_AGE.
+    """
+    if not os.path.exists(path):
+        return False
+    if os.path.exists(source):
+        return os.path.getmtime(path) >= os.path.getmtime(source)
+    return time.time() - os.path.getmtime(path) < SNAPSHOT_MAX_AGE
+
+def _write_snapshot(df: pl.DataFrame, null_counts: dict, path: str = SNAPSHOT_PATH) -> None:
+    """
+    WHY: Parquet is columnar and keeps dtypes, so the next cold start
+    reads it back instead of downloading and re-parsing the CSV.
+    - The raw stats (null counts, source column count) travel in the file's metadata.
+    - Written to a temp file and renamed into place: an interrupted write
+      (killed process, full disk) never leaves a truncated snapshot behind.
+    - A read-only disk only costs the speed-up, never the app.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.write_parquet(tmp, compression="zstd", metadata={NULL_COUNTS_KEY: json.dumps(null_counts)})
+        os.replace(tmp, path)
+    except (OSError, pl.exceptions.PolarsError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def as_pandas(df: pl.DataFrame, null_counts: dict | None = None) -> pd.DataFrame:
+    """
+    WHY: Arrow-backed columns take about half the memory of object strings.
+    - The load time stamped in attrs lets downstream caches (prep.frame_key)
+      tell one loaded dataset from another without hashing its values;
+      every frame handed to those caches must come through here.
+    - The raw stats in attrs (when given) feed prep.missing_rate and prep.source_columns.
+    """
+    out = df.to_pandas(use_pyarrow_extension_array=True)
+    out.attrs["loaded_at"] = time.time()
+    if null_counts is not None:
+        out.attrs["null_counts"] = null_counts
+    return out
+
+# ttl: a long-running server picks up the refreshed remote data once a day
+@st.cache_data(show_spinner=True, ttl=SNAPSHOT_MAX_AGE)
 def load_data() -> pd.DataFrame:
     """
-    Load the IRVE dataset directly from the official data.gouv.fr API link.
+    Load the IRVE dataset, fastest source first:
+    Parquet snapshot → local CSV (data/irve.csv) → official data.gouv.fr API link.
 
     - The file is downloaded and cached automatically (Streamlit handles it).
-    - No manual upload or local file required.
-    - Data is read directly into a pandas DataFrame.
+    - No manual upload required; a local CSV is optional.
+    - The CSV is parsed by Polars (multi-threaded) and handed over as a pandas
+      DataFrame with Arrow-backed columns (about half the memory of object strings).
+    - Only the columns listed in USED_COLS are parsed (one pass over the file).
+    - The parsed frame is snapshotted to data/irve_raw.parquet and reused while fresh.
     """
+    if _snapshot_is_fresh():
+        try:
+            null_counts = json.loads(pl.read_parquet_metadata(SNAPSHOT_PATH)[NULL_COUNTS_KEY])
+            # Older snapshots lack the column count (and counted nulls after the typed cast)
+            if "n_cols" in null_counts:
+                return as_pandas(pl.read_parquet(SNAPSHOT_PATH), null_counts)
+        except (OSError, KeyError, TypeError, ValueError, pl.exceptions.PolarsError):
+            pass  # unreadable snapshot, or one without raw stats: rebuild it below
+
     try:
-        st.info("Fetching dataset from data.gouv.fr...")
-        df = pd.read_csv(DATA_URL, sep=",")
-        st.success("Dataset successfully loaded from the online source.")
-        return df
+        if os.path.exists(LOCAL_CSV_PATH):
+            source = LOCAL_CSV_PATH
+        else:
+            st.info("Fetching dataset from data.gouv.fr...")
+            # Download once: the header and the projected read both use these bytes
+            with urlopen(DATA_URL) as resp:
+                source = resp.read()
+        df, null_counts = _read_irve_csv(source)
+        if isinstance(source, bytes):
+            st.success("Dataset successfully loaded from the online source.")
+        _write_snapshot(df, null_counts)
+        return as_pandas(df, null_counts)
 
     except Exception as e:
-        st.error("Failed to load dataset from the remote link.")
+        st.error("Failed to load the dataset (local file or remote link).")
         st.exception(e)
         st.stop()
@@ -1,6 +1,105 @@
+import os
+from dataclasses import dataclass
+
 import pandas as pd
 import numpy as np
+import polars as pl
+import pyarrow as pa
+import streamlit as st
+
+from utils.io import CLEAN_PATH, as_pandas, read_irve_csv
+from utils.viz import entity_counts
+
+def frame_key(df: pd.DataFrame) -> tuple:
+    """
+    Cheap cache key (shape + columns + load time) for frames returned by the cached loader/cleaner.
+
+    Why: those frames are fixed for a given dataset, so hashing every value on
+    each rerun would cost as much as the work being cached. The load time
+    (stamped in attrs by io.as_pandas) separates datasets of the same shape.
+    Unstamped frames are refused: two different datasets would share a key.
+    Not meant for locally filtered frames.
+    """
+    if "loaded_at" not in df.attrs:
+        raise ValueError("frame_key needs a frame stamped by utils.io.as_pandas (attrs['loaded_at'])")
+    return df.shape, tuple(df.columns), df.attrs["loaded_at"]
+
+def missing_rate(df: pd.DataFrame) -> pd.Series:
+    """
+    Share of missing values per column (same as df.isna().mean()).
+
+    Why: derived from the per-column non-null counts, so no N x C boolean frame
+    is allocated just to count gaps. For the raw frame, the loader's null counts
+    (attrs["null_counts"], taken before the typed cast) are used instead, so values
+    the cast rejects still count as present in the raw file. Only the parsed
+    columns (utils.io.USED_COLS) are covered.
+    """
+    n = len(df)
+    nulls = df.attrs.get("null_counts")
+    if nulls is not None and nulls["n_rows"] == n:
+        return pd.Series(nulls["counts"], dtype="float64") / n
+    return (n - df.count()) / n
+
+def source_columns(df: pd.DataFrame) -> int:
+    """
+    Number of columns in the source CSV, parsed or not (read from its header by the loader).
+
+    Why: the raw frame only holds the parsed columns; the sidebar describes the file.
+    """
+    nulls = df.attrs.get("null_counts")
+    return nulls["n_cols"] if nulls is not None else len(df.columns)
+
+@st.cache_data(show_spinner=False)
+def sorted_unique(s: pd.Series) -> list:
+    """
+    Sorted distinct non-null values of a column (e.g. options for a multiselect).
+
+    Why: several widgets list the same operators; caching avoids a full
+    scan + hash + sort of the column on every rerun.
+    """
+    return sorted(s.dropna().unique().tolist())
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: frame_key})
+def value_range(df: pd.DataFrame, col: str) -> tuple[float, float] | None:
+    """
+    (min, max) of a column, or None if it is missing or empty — e.g. slider bounds.
 
+    Why: widgets are rebuilt on every rerun; two full-column reductions just to
+    draw a slider are wasted once the dataset is loaded.
+    """
+    if col not in df.columns or not df[col].notna().any():
+        return None
+    return float(df[col].min()), float(df[col].max())
+
+@dataclass(frozen=True)
+class Aggregates:
+    """Full-dataset counts shared by the charts and their stories."""
+    operator_counts: pd.Series | None  # points per operator (entity_counts)
+    category_counts: pd.Series | None  # points per power category present
+    missing_rate: pd.Series            # share of missing values per column
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: frame_key})
+def build_aggregates(df: pd.DataFrame) -> Aggregates:
+    """
+    Counts for the unfiltered views, computed once per dataset.
+
+    Why: charts and their captions used to count the same columns separately
+    on each rerun; the default (unfiltered) views now read these instead.
+    """
+    op = entity_counts(df["nom_operateur"]) if "nom_operateur" in df.columns else None
+    cat = None
+    if "categorie_puissance" in df.columns:
+        vc = df["categorie_puissance"].value_counts()
+        cat = vc[vc > 0]
+    return Aggregates(operator_counts=op, category_counts=cat, missing_rate=missing_rate(df))
+
+@st.cache_data(
+    show_spinner="Cleaning and preparing data...",
+    # WHY: the input comes from the cached loader, so frame_key identifies it;
+    # this avoids hashing the whole raw frame on every rerun.
+    hash_funcs={pd.DataFrame: frame_key},
+    max_entries=4,
+)
 def clean_irve_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clean and prepare the IRVE dataset for analysis/visualization.
@@ -8,75 +107,132 @@ def clean_irve_data(df: pd.DataFrame) -> pd.DataFrame:
     This function applies a series of data quality improvements
     to make the dataset reliable for storytelling and mapping.
     Each step has a rationale: transparency, consistency, and usability.
+
+    The steps are built as one Polars lazy query: nothing runs until the end,
+    so casts, text cleaning, dedup and filtering execute in a single
+    multi-threaded plan without a pandas intermediate per step.
+    Cached: widget reruns reuse the cleaned frame instead of re-running the query.
     """
 
-    # --- 1. Work on a copy to avoid modifying the original dataset in memory ---
-    df = df.copy()
+    # --- 1. Start a lazy query on the loaded data (the original stays untouched) ---
+    # Why: the raw frame is still shown in the "before cleaning" stats;
+    # the Arrow-backed columns are shared with Polars, not copied.
+    lf = pl.from_pandas(df).lazy()
 
     # --- 2. Standardize column names (lowercase, no extra spaces) ---
     # Why: column names differ across data sources; cleaning them makes
     # code robust and easier to reuse in merges or visualizations.
-    df.columns = df.columns.str.strip().str.lower()
+    lf = lf.rename({c: c.strip().lower() for c in df.columns})
+    schema = lf.collect_schema()
+
+    # --- 3. Ensure latitude/longitude and power are numeric ---
+    # Why: these values sometimes come as strings or malformed numbers (e.g., "22 kW" → null).
+    # We coerce to numeric so the map doesn’t break and filters work correctly.
+    # float32 keeps ~7 significant digits (< 1 m here) at half the bytes of float64,
+    # and callers no longer need to re-coerce. One multi-column cast covers all three.
+    num_cols = [c for c in ["consolidated_latitude", "consolidated_longitude", "puissance_nominale"] if c in schema]
+    if num_cols:
+        lf = lf.with_columns(pl.col(num_cols).cast(pl.Float32, strict=False))
+
+    # Steps 4-5 filter rows first, so the per-row work of steps 6-8
+    # only runs on rows that are kept.
+
+    # --- 4. Remove rows with missing coordinates ---
+    # Why: mapping functions (pydeck, folium) crash if lat/lon are null.
+    # These rows can’t appear on a map, so we remove them safely.
+    if {"consolidated_latitude", "consolidated_longitude"}.issubset(schema):
+        lf = lf.drop_nulls(subset=["consolidated_latitude", "consolidated_longitude"])
+
+    # --- 5. Drop duplicates based on unique identifiers ---
+    # Why: some charge points appear twice in the open dataset
+    # (e.g., local vs itinerant IDs). Keeping one prevents double-counting.
+    # Done after step 4, so a mappable copy wins over one without coordinates.
+    # One 64-bit hash per key combination is cheaper to deduplicate than the
+    # string keys themselves (~2x vs unique(); a collision at this size is ~1e-8).
+    keys = [k for k in ["id_pdc_itinerance", "id_pdc_local"] if k in schema]
+    if keys:
+        lf = lf.filter(pl.struct(keys).hash().is_first_distinct())
+
+    exprs = []
 
-    # --- 3. Convert the installation date to datetime + extract year ---
+    # --- 6. Convert the installation date to datetime + extract year ---
     # Why: dates are often stored as text, but to plot time trends,
     # we need real datetime objects. The year helps group and filter easily.
-    if "date_mise_en_service" in df.columns:
-        df["date_mise_en_service"] = pd.to_datetime(df["date_mise_en_service"], errors="coerce")
-        df["annee_mise_en_service"] = df["date_mise_en_service"].dt.year
+    # The IRVE schema stores YYYY-MM-DD: an explicit format skips format guessing,
+    # and a nullable Int16 year is all the filters and charts need.
+    if "date_mise_en_service" in schema:
+        date = pl.col("date_mise_en_service")
+        if schema["date_mise_en_service"] == pl.String:
+            date = date.str.to_datetime("%Y-%m-%d", strict=False)
+        exprs += [date, date.dt.year().cast(pl.Int16).alias("annee_mise_en_service")]
 
-    # --- 4. Ensure latitude/longitude are numeric ---
-    # Why: these values sometimes come as strings or malformed numbers.
-    # We coerce to numeric so the map doesn’t break and filters work correctly.
-    for col in ["consolidated_latitude", "consolidated_longitude"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # --- 5. Standardize charging power and classify it into categories ---
+    # --- 7. Classify charging power into categories ---
     # Why: the dataset contains numeric power values (kW),
     # but grouping them into human-readable categories helps storytelling
     # (“Normal”, “Fast”, “Ultra-fast”) and consistent color-coding on visuals.
-    if "puissance_nominale" in df.columns:
-        # Convert to numeric to avoid text errors (e.g., "22 kW" → 22)
-        df["puissance_nominale"] = pd.to_numeric(df["puissance_nominale"], errors="coerce")
+    if "puissance_nominale" in schema:
+        power = pl.col("puissance_nominale")  # float32 since step 3
 
-        # Define bins and labels based on charging speed
+        # Define bins and labels based on charging speed ([lo, hi) intervals;
+        # values outside [0, 1000) get no category)
         bins = [0, 22, 50, 150, 1000]
         labels = ["Normal (<22kW)", "Fast (22–50kW)", "Very fast (50–150kW)", "Ultra-fast (>150kW)"]
-        df["categorie_puissance"] = pd.cut(
-            df["puissance_nominale"], bins=bins, labels=labels, right=False
-        )
+        cat = pl.when(power.is_between(bins[0], bins[1], closed="left")).then(pl.lit(labels[0]))
+        for lo, hi, label in zip(bins[1:-1], bins[2:], labels[1:]):
+            cat = cat.when(power.is_between(lo, hi, closed="left")).then(pl.lit(label))
+        # Enum: an ordered categorical, so charts keep the speed order
+        exprs.append(cat.cast(pl.Enum(labels)).alias("categorie_puissance"))
 
-    # --- 6. Clean key text fields (operator, municipality names) ---
+    # --- 8. Clean key text fields (operator, municipality names) ---
     # Why: inconsistent capitalization (“TOTALENERGIES”, “Total energies”)
     # creates duplicates in aggregations. We unify to title case for readability.
+    # Stored as categories: few distinct names over many rows, so filters and
+    # counts work on small int codes instead of hashing strings.
     for col in ["nom_amenageur", "nom_operateur", "nom_commune"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.title().str.strip()
-
-    # --- 7. Drop duplicates based on unique identifiers ---
-    # Why: some charge points appear twice in the open dataset
-    # (e.g., local vs itinerant IDs). Keeping one prevents double-counting.
-    keys = [k for k in ["id_pdc_itinerance", "id_pdc_local"] if k in df.columns]
-    if keys:
-        df = df.drop_duplicates(subset=keys, keep="first")
+        if col in schema:
+            exprs.append(
+                pl.col(col).cast(pl.String).str.strip_chars().str.to_titlecase().cast(pl.Categorical)
+            )
 
-    # --- 8. Remove rows with missing coordinates ---
-    # Why: mapping functions (pydeck, folium) crash if lat/lon are null.
-    # These rows can’t appear on a map, so we remove them safely.
-    if {"consolidated_latitude", "consolidated_longitude"}.issubset(df.columns):
-        df = df.dropna(subset=["consolidated_latitude", "consolidated_longitude"])
+    lf = lf.with_columns(exprs)
 
     # --- 9. Keep only relevant columns for the dashboard ---
     # Why: reduces memory use and makes caching faster.
     # Keeps only columns needed for KPIs, filters, and visualizations.
+    # The optimizer pushes this projection up, so dropped columns are never transformed.
     keep = [
         "nom_amenageur", "nom_operateur", "nom_commune",
         "consolidated_latitude", "consolidated_longitude",
         "puissance_nominale", "categorie_puissance",
         "date_mise_en_service", "annee_mise_en_service",
     ]
-    keep = [c for c in keep if c in df.columns]
+    names = lf.collect_schema().names()
+    keep = [c for c in keep if c in names]
+
+    # --- 10. Run the query and return a clean, compact DataFrame ready for visualizations ---
+    # Why: the charts expect pandas. The collected frame is converted once, with no
+    # defensive copy; int16 maps straight to nullable Int16 (a plain conversion would
+    # turn a year column with gaps into float64 and need another pass to undo it).
+    out = lf.select(keep).collect().to_pandas(types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+    # Keep the dataset stamp for frame_key (not the raw null counts: other rows and columns)
+    out.attrs["loaded_at"] = df.attrs["loaded_at"]
+    return out
 
-    # --- 10. Return a clean, compact DataFrame ready for visualizations ---
-    return df[keep].copy()
+def build_cache(csv_path: str, parquet_path: str = CLEAN_PATH) -> pd.DataFrame:
+    """
+    Clean an IRVE CSV once and store the result as Parquet (e.g. data/irve_clean.parquet).
+
+    Why: notebooks and exports can read the analysis-ready columns directly,
+    without re-parsing the CSV and re-running the cleaning each time.
+    Categories are written dictionary-encoded and read back as categories.
+    The app itself keeps cleaning the raw snapshot: its "before cleaning"
+    stats and quality checks need the raw frame anyway.
+    """
+    # Stamped so the cached cleaner keys this CSV apart from any other of the same shape
+    df = clean_irve_data(as_pandas(read_irve_csv(csv_path)))
+    os.makedirs(os.path.dirname(os.path.abspath(parquet_path)), exist_ok=True)
+    df.to_parquet(
+        parquet_path, engine="pyarrow", compression="snappy",
+        use_dictionary=True, row_group_size=200_000,
+    )
+    return df
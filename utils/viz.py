@@ -12,32 +12,54 @@ def _ensure_datetime(df: pd.DataFrame, col: str) -> pd.Series:
     WHY: Many open datasets store dates as strings.
     Converting with errors='coerce' guarantees we get real datetimes for time series,
     and silently drops invalid ones instead of crashing the app.
+    - Columns already parsed (e.g. by clean_irve_data) are returned as is.
+    - Strings are parsed as ISO 8601 (the IRVE format), avoiding per-value format guessing.
     """
     if col not in df.columns:
         raise KeyError(f"Column '{col}' not found.")
-    return pd.to_datetime(df[col], errors="coerce")
+    if pd.api.types.is_datetime64_any_dtype(df[col]):
+        return df[col]
+    return pd.to_datetime(df[col], errors="coerce", format="ISO8601", cache=True)
 
 def _ensure_numeric(df: pd.DataFrame, col: str) -> pd.Series:
     """
     WHY: Plotting, bins, and map sizing require numeric values.
     errors='coerce' turns bad values into NaN so visuals remain stable.
+    - Columns already numeric (numpy or Arrow-backed) are returned as is: no copy.
     """
     if col not in df.columns:
         raise KeyError(f"Column '{col}' not found.")
+    if pd.api.types.is_numeric_dtype(df[col]):
+        return df[col]
     return pd.to_numeric(df[col], errors="coerce")
 
+# Power categories from slowest to fastest (labels set by clean_irve_data)
+_POWER_ORDER = [
+    "Normal (<22kW)",
+    "Fast (22–50kW)",
+    "Very fast (50–150kW)",
+    "Ultra-fast (>150kW)",
+]
+# Built once at import: _order_power_categories runs on every chart render
+_POWER_DTYPE = pd.CategoricalDtype(categories=_POWER_ORDER, ordered=True)
+
 def _order_power_categories(series: pd.Series) -> pd.Series:
     """
     WHY: Enforce a human-understandable order for power categories
     so bars appear Normal→Fast→Very fast→Ultra-fast instead of alphabetical.
     """
-    cat_order = [
-        "Normal (<22kW)",
-        "Fast (22–50kW)",
-        "Very fast (50–150kW)",
-        "Ultra-fast (>150kW)",
-    ]
-    return series.astype(pd.CategoricalDtype(categories=cat_order, ordered=True))
+    return series.astype(_POWER_DTYPE)
+
+def entity_counts(series: pd.Series) -> pd.Series:
+    """
+    WHY: Rankings count missing names as “Unknown” and must only list entities present.
+    - Categorical columns need the “Unknown” label registered before fillna.
+    - Categorical value_counts also reports unused categories (0) — drop them.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) and "Unknown" not in series.cat.categories:
+        series = series.cat.add_categories(["Unknown"])
+    vc = series.fillna("Unknown").value_counts()
+    return vc[vc > 0]
 
 # -----------------------------
 # Map (pydeck)
@@ -55,34 +77,43 @@ def map_irve_points(
     - Robust casting avoids failures due to bad lat/lon.
     - Point size scales (softly) with power to hint at capacity without clutter.
     - Green markers echo EV/eco semantics and improve contrast on light basemaps.
+    - Only the columns the layer and tooltips use are copied: pydeck sends every column to the browser.
     """
     if tooltip_cols is None:
         tooltip_cols = []
 
-    df = df.copy()
-    df["__lat"] = _ensure_numeric(df, lat_col)
-    df["__lon"] = _ensure_numeric(df, lon_col)
-    # Size cap avoids giant circles from extreme values while still encoding power
-    df["__size"] = (
-        np.clip(_ensure_numeric(df, puissance_col).fillna(7), 5, 40)
-        if puissance_col in df.columns else 8
-    )
+    keep = [c for c in tooltip_cols if c in df.columns]
+    if puissance_col in df.columns and puissance_col not in keep:
+        keep.append(puissance_col)
+    data = df[keep].copy()
+    # float32 coordinates would serialize as 48.849998474121094; 5 decimals (~1 m)
+    # keep tooltips readable and the JSON payload short
+    data["__lat"] = _ensure_numeric(df, lat_col).astype("float64").round(5)
+    data["__lon"] = _ensure_numeric(df, lon_col).astype("float64").round(5)
+    # Size cap avoids giant circles from extreme values while still encoding power.
+    # One float64 array (an explicit copy, never a view of df) filled and clipped in place.
+    if puissance_col in df.columns:
+        size = _ensure_numeric(df, puissance_col).to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        np.nan_to_num(size, copy=False, nan=7.0)
+        np.clip(size, 5, 40, out=size)
+        data["__size"] = size
+    else:
+        data["__size"] = 8
 
     # Center on France by default; sensible starting zoom for a national view
     if initial_view is None:
         initial_view = dict(latitude=46.6, longitude=2.5, zoom=5.3, pitch=0, bearing=0)
 
     # Build compact, informative tooltips (only existing columns)
-    tooltip_text = "<b>Lat:</b> {__lat}<br/><b>Lon:</b> {__lon}"
-    for c in tooltip_cols:
-        if c in df.columns:
-            tooltip_text += f"<br/><b>{c}:</b> {{{c}}}"
+    parts = ["<b>Lat:</b> {__lat}<br/><b>Lon:</b> {__lon}"]
+    parts += [f"<br/><b>{c}:</b> {{{c}}}" for c in tooltip_cols if c in df.columns]
     if puissance_col in df.columns:
-        tooltip_text += f"<br/><b>Power (kW):</b> {{{puissance_col}}}"
+        parts.append(f"<br/><b>Power (kW):</b> {{{puissance_col}}}")
+    tooltip_text = "".join(parts)
 
     layer = pdk.Layer(
         "ScatterplotLayer",
-        data=df.dropna(subset=["__lat", "__lon"]),  # drop rows that can’t be mapped
+        data=data.dropna(subset=["__lat", "__lon"]),  # drop rows that can’t be mapped
         get_position=["__lon", "__lat"],
         get_radius="__size * 200",                 # WHY: perceptible sizing without covering the map
         radius_min_pixels=2,
@@ -100,6 +131,33 @@ def map_irve_points(
         map_style="light",
     )
 
+def grid_aggregate_points(
+    df: pd.DataFrame,
+    lat_col: str = "consolidated_latitude",
+    lon_col: str = "consolidated_longitude",
+    puissance_col: str = "puissance_nominale",
+    step: float = 0.05,
+) -> pd.DataFrame:
+    """
+    WHY: Hundreds of thousands of points overwhelm the websocket and the browser.
+    - Snapping coordinates to a ~5 km grid keeps the national picture (corridors, clusters, deserts).
+    - Each cell keeps its number of points and mean power, so the map still hints at capacity.
+    - Output reuses the input column names, so it can be passed straight to map_irve_points.
+    - float64 cells: tiny output, and float32 means would print as 59.79999923706055 in tooltips.
+    """
+    cells = pd.DataFrame({
+        lat_col: (_ensure_numeric(df, lat_col).astype("float64") / step).round() * step,
+        lon_col: (_ensure_numeric(df, lon_col).astype("float64") / step).round() * step,
+    })
+    if puissance_col in df.columns:
+        cells[puissance_col] = _ensure_numeric(df, puissance_col).astype("float64")
+
+    grid = cells.dropna(subset=[lat_col, lon_col]).groupby([lat_col, lon_col], sort=False)
+    out = grid.size().rename("nb_points").to_frame()
+    if puissance_col in cells.columns:
+        out[puissance_col] = grid[puissance_col].mean().round(1)
+    return out.reset_index()
+
 # -----------------------------
 # Time series
 # -----------------------------
@@ -112,11 +170,24 @@ def line_installations_over_time(
     """
     WHY: Tracking new installations reveals acceleration vs. slowdown — essential for policy/investment pacing.
     - Period grouping (Y/Q/M) provides flexible storytelling (annual strategy vs. seasonal rollouts).
+    - Y/Q/M are counted on integer period numbers (e.g. year * 12 + month - 1):
+      no Period object per row, and only the few aggregated periods get a label.
     """
-    s = _ensure_datetime(df, date_col)
-    ts = s.dropna().dt.to_period(freq).value_counts().sort_index()
+    s = _ensure_datetime(df, date_col).dropna()
+    year = s.dt.year
+    if freq == "Y":
+        keys, label = year, str
+    elif freq == "Q":
+        keys = year * 4 + s.dt.quarter - 1
+        label = lambda k: f"{k // 4}Q{k % 4 + 1}"
+    elif freq == "M":
+        keys = year * 12 + s.dt.month - 1
+        label = lambda k: f"{k // 12}-{k % 12 + 1:02d}"
+    else:
+        keys, label = s.dt.to_period(freq), str
+    ts = keys.value_counts().sort_index()
     ts = ts.rename_axis("period").reset_index(name="count")
-    ts["period"] = ts["period"].astype(str)
+    ts["period"] = ts["period"].map(label)
 
     fig = px.line(ts, x="period", y="count", markers=True, title=title)
     fig.update_traces(hovertemplate="Period=%{x}<br>Points=%{y}")
@@ -134,14 +205,18 @@ def bar_top_entities(
     entity_col: str = "nom_operateur",
     top_n: int = 15,
     title: str | None = None,
+    counts: pd.Series | None = None,
 ) -> go.Figure:
     """
     WHY: Market structure matters — concentration vs. fragmentation impacts roaming, pricing, and resilience.
     - Horizontal bars + sorting highlight relative magnitudes with readable labels.
+    - `counts` (output of entity_counts) lets callers reuse counts they already have.
     """
     if entity_col not in df.columns:
         raise KeyError(f"Column '{entity_col}' not found.")
-    vc = df[entity_col].fillna("Unknown").value_counts().head(top_n).sort_values(ascending=True)
+    if counts is None:
+        counts = entity_counts(df[entity_col])
+    vc = counts.head(top_n).sort_values(ascending=True)
     data = vc.reset_index(); data.columns = [entity_col, "count"]
 
     if title is None:
@@ -162,15 +237,25 @@ def bar_power_categories(
     df: pd.DataFrame,
     cat_col: str = "categorie_puissance",
     title: str = "Charging power categories",
+    counts: pd.Series | None = None,
 ) -> go.Figure:
     """
     WHY: Power levels define user experience (minutes vs. hours).
     Showing the mix clarifies whether the network favors destination charging or high-speed corridors.
+    - `counts` (points per category) lets callers reuse counts they already have.
+    - Otherwise counted with a bincount on the categorical codes (no string casts).
     """
     if cat_col not in df.columns:
         raise KeyError(f"Column '{cat_col}' not found.")
-    ser = _order_power_categories(df[cat_col].astype(str))
-    counts = pd.Series(ser).value_counts().reindex(ser.cat.categories, fill_value=0)
+    if counts is None:
+        ser = df[cat_col]
+        if isinstance(ser.dtype, pd.CategoricalDtype):
+            ser = ser.cat.set_categories(_POWER_ORDER)  # remaps the codes, values untouched
+        else:
+            ser = _order_power_categories(ser.astype(str))
+        codes = ser.cat.codes.to_numpy()
+        counts = pd.Series(np.bincount(codes[codes >= 0], minlength=len(_POWER_ORDER)), index=_POWER_ORDER)
+    counts = counts.reindex(_POWER_ORDER, fill_value=0)
     data = counts.reset_index(); data.columns = [cat_col, "count"]
 
     fig = px.bar(data, x=cat_col, y="count", text="count", title=title)
@@ -189,17 +274,26 @@ def hist_power_distribution(
     power_col: str = "puissance_nominale",
     title: str = "Power distribution (kW)",
     nbins: int = 40,
+    cap99: bool = True,
 ) -> go.Figure:
     """
     WHY: The distribution reveals typical charging speeds and whether there’s a high-kW tail for corridors.
     - 99th percentile cap keeps a few extreme values from flattening the entire histogram.
+    - Binned here with np.histogram: the browser receives `nbins` bars, not every value.
     """
-    s = _ensure_numeric(df, power_col).dropna()
-    cap = np.nanpercentile(s, 99)
-    s = s.clip(upper=cap)
+    a = _ensure_numeric(df, power_col).dropna().to_numpy(dtype="float64")
+    if cap99 and a.size:
+        # percentile selects with a partition, no full sort
+        a = np.minimum(a, np.percentile(a, 99))
+    counts, edges = np.histogram(a, bins=nbins)
 
-    fig = px.histogram(s, nbins=nbins, title=title)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="%{customdata[0]:.0f}–%{customdata[1]:.0f} kW<br>Points=%{y}<extra></extra>",
+    ))
     fig.update_layout(
+        title=title, bargap=0,
         xaxis_title="Power (kW)", yaxis_title="Number of points",
         margin=dict(l=10, r=10, t=60, b=10)
     )
@@ -212,12 +306,19 @@ def bar_missingness(
     df: pd.DataFrame,
     top_n: int = 20,
     title: str = "Top columns by missing rate",
+    miss: pd.Series | None = None,
 ) -> go.Figure:
     """
     WHY: Transparency about data quality builds trust.
     Surfacing the most incomplete fields guides cleaning priorities and prevents misinterpretation.
+    - Rates come from the per-column non-null counts (read from the null bitmap on
+      Arrow-backed columns) instead of an N x C boolean frame.
+    - `miss` (share missing per column, e.g. prep.missing_rate) overrides the rates from df.
     """
-    miss = df.isnull().mean().sort_values(ascending=False).head(top_n) * 100
+    if miss is None:
+        n = len(df)
+        miss = (n - df.count()) / n
+    miss = miss.sort_values(ascending=False).head(top_n) * 100
     data = miss.sort_values(ascending=True).reset_index()
     data.columns = ["column", "pct_missing"]
 